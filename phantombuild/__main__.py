@@ -1,11 +1,34 @@
 """Phantom-build command line program."""
 
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import click
 
 from . import __version__
 from .phantombuild import build_phantom, read_config, setup_calculation, write_config
 
 
+def _check_paths(conf):
+    """Check user-supplied paths in a config before any subprocess runs.
+
+    This avoids discovering a missing setup, in, or patch file deep in
+    the call graph after a possibly long Phantom build.
+    """
+    phantom = conf['phantom']
+    for patch in phantom.get('patches') or ():
+        if not Path(patch).expanduser().exists():
+            raise click.BadParameter(f'patch file "{patch}" does not exist')
+    hdf5_path = phantom.get('hdf5_path')
+    if hdf5_path is not None and not Path(hdf5_path).expanduser().is_dir():
+        raise click.BadParameter(f'hdf5_path "{hdf5_path}" is not a directory')
+    for run in conf.get('runs', []):
+        for key in ('setup_file', 'in_file', 'job_script'):
+            path = run.get(key)
+            if path is not None and not Path(path).expanduser().exists():
+                raise click.BadParameter(f'{key} "{path}" does not exist')
+
+
 @click.group()
 @click.version_option(version=__version__)
 def cli():
@@ -24,21 +47,44 @@ def template(filename):
 
 @cli.command()
 @click.argument('config', nargs=-1, type=click.Path(exists=True))
+@click.option(
+    '--make-jobs',
+    default=None,
+    type=int,
+    help='Number of parallel make jobs; defaults to the number of CPU cores.',
+)
 @click.pass_context
-def build(ctx, config):
+def build(ctx, config, make_jobs):
     """Build Phantom."""
     if len(config) == 0:
         click.echo(ctx.get_help())
         ctx.exit()
-    for _config in config:
-        conf = read_config(_config)
-        build_phantom(**conf['phantom'])
+    confs = [read_config(_config) for _config in config]
+    for conf in confs:
+        _check_paths(conf)
+    built = set()
+    for conf in confs:
+        if repr(conf['phantom']) not in built:
+            build_phantom(**conf['phantom'], make_jobs=make_jobs)
+            built.add(repr(conf['phantom']))
 
 
 @cli.command()
 @click.argument('config', nargs=-1, type=click.Path(exists=True))
+@click.option(
+    '--jobs',
+    default=1,
+    type=int,
+    help='Number of runs to set up concurrently.',
+)
+@click.option(
+    '--make-jobs',
+    default=None,
+    type=int,
+    help='Number of parallel make jobs; defaults to the number of CPU cores.',
+)
 @click.pass_context
-def setup(ctx, config):
+def setup(ctx, config, jobs, make_jobs):
     """Build and set up Phantom runs.
 
     phantombuild compiles Phantom and sets up one or more runs. Pass in
@@ -48,13 +94,33 @@ def setup(ctx, config):
     if len(config) == 0:
         click.echo(ctx.get_help())
         ctx.exit()
-    for _config in config:
-        conf = read_config(_config)
-        build_phantom(**conf['phantom'])
+    confs = [read_config(_config) for _config in config]
+    for conf in confs:
+        _check_paths(conf)
+    built = set()
+    for conf in confs:
+        if repr(conf['phantom']) not in built:
+            build_phantom(**conf['phantom'], make_jobs=make_jobs)
+            built.add(repr(conf['phantom']))
         phantom_path = conf['phantom']['path']
-        for run in conf.get('runs', []):
-            run_path = run.pop('path')
-            setup_calculation(run_path=run_path, phantom_path=phantom_path, **run)
+        runs = conf.get('runs', [])
+        if jobs > 1 and len(runs) > 1:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [
+                    executor.submit(
+                        setup_calculation,
+                        run_path=run.pop('path'),
+                        phantom_path=phantom_path,
+                        **run,
+                    )
+                    for run in runs
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            for run in runs:
+                run_path = run.pop('path')
+                setup_calculation(run_path=run_path, phantom_path=phantom_path, **run)
 
 
 if __name__ == '__main__':
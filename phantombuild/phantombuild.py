@@ -1,6 +1,10 @@
 """Phantom build."""
 
+import atexit
+import functools
+import json
 import logging
+import logging.handlers
 import os
 import pathlib
 import shutil
@@ -8,7 +12,7 @@ import subprocess
 import sys
 from logging import Logger
 from pathlib import Path
-from typing import Any, Dict, List, Union
+from typing import IO, Any, Dict, List, Set, Tuple, Union
 
 import tomlkit
 from jinja2 import Template
@@ -70,8 +74,15 @@ def _setup_logger(filename: Path = None) -> Logger:
     console_handler.setFormatter(console_format)
     file_handler.setFormatter(file_format)
 
+    # Buffer file records in memory to avoid a write() syscall per log
+    # record; errors and exit flush the buffer.
+    memory_handler = logging.handlers.MemoryHandler(
+        1024, flushLevel=logging.ERROR, target=file_handler
+    )
+    atexit.register(memory_handler.close)
+
     logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(memory_handler)
 
     logger.setLevel(logging.INFO)
 
@@ -80,6 +91,20 @@ def _setup_logger(filename: Path = None) -> Logger:
 
 logger = _setup_logger()
 
+# Cache of resolved git revisions, keyed by the repository path, the
+# requested version, and the modification time of .git/HEAD. The mtime
+# invalidates the cache whenever HEAD changes, e.g. after a checkout.
+_REV_PARSE_CACHE: Dict[Tuple[Path, str, float], Tuple[str, str]] = {}
+
+# Successful get_phantom calls, keyed by the repository path and the
+# mtime of .git/config so a damaged or replaced repository is rechecked.
+_GET_PHANTOM_CACHE: Set[Tuple[Path, float]] = set()
+
+# Successful checkout_phantom_version calls, keyed by repository path
+# and version; patch_phantom invalidates entries as patches dirty the
+# worktree that a checkout would otherwise clean.
+_CHECKOUT_CACHE: Set[Tuple[Path, str]] = set()
+
 
 def get_phantom(path: Union[Path, str]) -> bool:
     """Get Phantom repository.
@@ -100,13 +125,20 @@ def get_phantom(path: Union[Path, str]) -> bool:
         If the repository can not be cloned.
     """
     _path = _resolved_path(path)
+    try:
+        cache_key = (_path, (_path / '.git' / 'config').stat().st_mtime)
+    except OSError:
+        cache_key = None
+    if cache_key is not None and cache_key in _GET_PHANTOM_CACHE:
+        return True
     logger.info('Getting Phantom repository')
     logger.info(f'path: {_path}')
 
     if not _path.exists():
         logger.info('Cloning fresh copy of Phantom')
         result = subprocess.run(
-            ['git', 'clone', REPO_URL, _path.stem], cwd=_path.parent,
+            ['git', 'clone', '--filter=blob:none', REPO_URL, _path.stem],
+            cwd=_path.parent,
         )
         if result.returncode != 0:
             logger.error('Phantom clone failed')
@@ -129,6 +161,11 @@ def get_phantom(path: Union[Path, str]) -> bool:
         else:
             logger.info('Phantom already cloned')
 
+    try:
+        _GET_PHANTOM_CACHE.add((_path, (_path / '.git' / 'config').stat().st_mtime))
+    except OSError:
+        pass
+
     return True
 
 
@@ -153,21 +190,47 @@ def checkout_phantom_version(path: Union[Path, str], version: str) -> bool:
         If the required version cannot be checked out.
     """
     _path = _resolved_path(path)
+    if (_path, version) in _CHECKOUT_CACHE:
+        return True
     logger.info('Getting required Phantom version')
 
     # Check git commit hash
-    phantom_git_commit_hash = subprocess.run(
-        ['git', 'rev-parse', 'HEAD'], cwd=_path, stdout=subprocess.PIPE, text=True,
-    ).stdout.strip()
-    short_hash = subprocess.run(
-        ['git', 'rev-parse', '--short', version],
-        cwd=_path,
-        stdout=subprocess.PIPE,
-        text=True,
-    ).stdout.strip()
+    try:
+        cache_key = (_path, version, (_path / '.git' / 'HEAD').stat().st_mtime)
+    except OSError:
+        cache_key = None
+    if cache_key is not None and cache_key in _REV_PARSE_CACHE:
+        phantom_git_commit_hash, short_hash = _REV_PARSE_CACHE[cache_key]
+    else:
+        result = subprocess.run(
+            ['git', 'rev-parse', version, 'HEAD'],
+            cwd=_path,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        if result.returncode != 0:
+            # An unresolvable version is echoed literally and git exits
+            # before printing HEAD; do not trust the output or cache it,
+            # and let the checkout below fail with RepoError
+            phantom_git_commit_hash = ''
+            short_hash = version[:7]
+        else:
+            revisions = result.stdout.split()
+            short_hash = revisions[0][:7] if revisions else ''
+            phantom_git_commit_hash = revisions[-1] if revisions else ''
+            if cache_key is not None:
+                _REV_PARSE_CACHE[cache_key] = (phantom_git_commit_hash, short_hash)
     logger.info(f'Git commit hash: {short_hash}')
     if phantom_git_commit_hash != version:
         logger.info('Checking out required Phantom version')
+        have_commit = subprocess.run(
+            ['git', 'cat-file', '-e', f'{version}^{{commit}}'],
+            cwd=_path,
+            stderr=subprocess.DEVNULL,
+        )
+        if have_commit.returncode != 0:
+            logger.info('Fetching required version from origin')
+            subprocess.run(['git', 'fetch', 'origin', version], cwd=_path)
         result = subprocess.run(['git', 'checkout', version], cwd=_path)
         if result.returncode != 0:
             msg = 'Failed to checkout required version'
@@ -184,17 +247,24 @@ def checkout_phantom_version(path: Union[Path, str], version: str) -> bool:
     ).stdout.strip()
     if not git_status == '':
         logger.info('Cleaning repository')
-        results = list()
-        results.append(subprocess.run(['git', 'reset', 'HEAD'], cwd=_path))
-        results.append(subprocess.run(['git', 'clean', '--force'], cwd=_path))
-        results.append(subprocess.run(['git', 'checkout', '--', '*'], cwd=_path))
-        if any(result.returncode != 0 for result in results):
+        # 'reset' only touches the index and 'clean' only untracked
+        # files, so the two can run concurrently; 'checkout' depends on
+        # the reset index and runs after both
+        reset = subprocess.Popen(['git', 'reset', 'HEAD'], cwd=_path)
+        clean = subprocess.Popen(['git', 'clean', '--force'], cwd=_path)
+        returncodes = [reset.wait(), clean.wait()]
+        returncodes.append(
+            subprocess.run(['git', 'checkout', '--', '.'], cwd=_path).returncode
+        )
+        if any(returncode != 0 for returncode in returncodes):
             msg = 'Failed to clean repo'
             logger.error(msg)
             raise RepoError(msg)
         else:
             logger.info('Successfully cleaned repo')
 
+    _CHECKOUT_CACHE.add((_path, version))
+
     return True
 
 
@@ -232,6 +302,10 @@ def patch_phantom(path: Union[Path, str], patch: Union[Path, str]) -> bool:
     else:
         logger.info('Successfully patched Phantom')
 
+    # The worktree is now dirty; force the next checkout to clean it
+    for key in [k for k in _CHECKOUT_CACHE if k[0] == _path]:
+        _CHECKOUT_CACHE.discard(key)
+
     return True
 
 
@@ -244,6 +318,7 @@ def build_phantom(
     system: str,
     hdf5_path: Union[Path, str] = None,
     extra_options: Dict[str, str] = None,
+    make_jobs: int = None,
 ) -> bool:
     """Build Phantom.
 
@@ -266,6 +341,9 @@ def build_phantom(
     extra_options
         Extra options to pass to make. This values in this dictionary
         should be strings only.
+    make_jobs
+        The number of parallel make jobs, passed to make as -j. If None,
+        use the number of available CPU cores.
 
     Returns
     -------
@@ -302,7 +380,9 @@ def build_phantom(
     if extra_options is not None:
         logger.info(f'extra_options: {extra_options}')
 
-    make_command = ['make', 'SETUP=' + setup, 'SYSTEM=' + system]
+    if make_jobs is None:
+        make_jobs = os.cpu_count() or 1
+    make_command = ['make', f'-j{make_jobs}', 'SETUP=' + setup, 'SYSTEM=' + system]
 
     if hdf5_path is not None:
         _hdf5_path = _resolved_path(hdf5_path)
@@ -313,20 +393,27 @@ def build_phantom(
     if extra_options is not None:
         make_command += [key + '=' + val for key, val in extra_options.items()]
 
+    build_config = {
+        'version': version,
+        'setup': setup,
+        'system': system,
+        'hdf5_path': str(_resolved_path(hdf5_path)) if hdf5_path is not None else None,
+        'extra_options': dict(extra_options) if extra_options is not None else None,
+    }
+    if _phantom_up_to_date(_path, build_config):
+        logger.info('Phantom binaries are up to date; skipping make')
+        return True
+
     build_log = _path / 'build' / 'build_output.log'
-    with open(build_log, 'w') as fp:
+    with open(build_log, 'wb', buffering=1 << 16) as fp:
         process = subprocess.Popen(
             make_command,
             cwd=_path,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            universal_newlines=True,
         )
-        assert process.stdout is not None
-        for line in process.stdout:
-            sys.stdout.write(line)
-            fp.write(line)
-        process.communicate()[0]
+        _tee_output(process, fp)
+        process.wait()
 
     if process.returncode != 0:
         msg = 'Phantom failed to compile'
@@ -337,20 +424,15 @@ def build_phantom(
         logger.info('Successfully compiled Phantom')
         logger.info(f'See "{build_log.name}" in Phantom build directory for output')
 
-    build_log = _path / 'build' / 'build_output.log'
-    with open(build_log, 'a') as fp:
+    with open(build_log, 'ab', buffering=1 << 16) as fp:
         process = subprocess.Popen(
             make_command + ['setup'],
             cwd=_path,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            universal_newlines=True,
         )
-        assert process.stdout is not None
-        for line in process.stdout:
-            sys.stdout.write(line)
-            fp.write(line)
-        process.communicate()[0]
+        _tee_output(process, fp)
+        process.wait()
 
     if process.returncode != 0:
         msg = 'Phantomsetup failed to compile'
@@ -361,6 +443,9 @@ def build_phantom(
         logger.info('Successfully compiled Phantomsetup')
         logger.info(f'See "{build_log.name}" in Phantom build directory for output')
 
+    with open(_path / 'build' / 'build_config.json', 'w') as fp:
+        json.dump(build_config, fp)
+
     return True
 
 
@@ -459,24 +544,19 @@ def setup_calculation(
         _run_path.mkdir(parents=True)
 
     for file in ['phantom', 'phantomsetup', 'phantom_version']:
-        shutil.copy(_phantom_path / 'bin' / file, _run_path)
+        _stage_file(_phantom_path / 'bin' / file, _run_path)
 
     shutil.copy(_setup_file, _run_path)
-    shutil.copy(_in_file, _run_path)
 
-    with open(_run_path / f'{prefix}00.log', mode='w') as f:
+    with open(_run_path / f'{prefix}00.log', mode='wb', buffering=1 << 16) as f:
         process = subprocess.Popen(
             ['./phantomsetup', prefix],
             cwd=_run_path,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            universal_newlines=True,
         )
-        assert process.stdout is not None
-        for line in process.stdout:
-            sys.stdout.write(line)
-            f.write(line)
-        process.communicate()[0]
+        _tee_output(process, f)
+        process.wait()
 
     if process.returncode != 0:
         msg = 'Phantom failed to set up calculation'
@@ -485,6 +565,7 @@ def setup_calculation(
     else:
         logger.info('Successfully set up Phantom calculation')
 
+    # Overwrite the .in file generated by phantomsetup with the user's
     shutil.copy(_in_file, _run_path)
 
     # Schedule calculation (if required)
@@ -543,10 +624,15 @@ def read_config(filename: Union[Path, str]) -> Dict[str, Any]:
     config: Dict[str, Any] = dict()
 
     d = {key: data['phantom'].get(key) for key in phantom_keys}
-    d['extra_options'] = {
-        item.split('=')[0]: item.split('=')[1]
-        for item in data['phantom'].get('extra_options', [])
-    }
+    extra_options = dict()
+    for item in data['phantom'].get('extra_options', []):
+        key, sep, val = item.partition('=')
+        if sep == '':
+            msg = f'Cannot parse extra option "{item}": expected "KEY=VALUE"'
+            logger.error(msg)
+            raise TOMLError(msg)
+        extra_options[key] = val
+    d['extra_options'] = extra_options
     config['phantom'] = d
 
     runs = data.get('runs')
@@ -578,5 +664,69 @@ def write_config(filename: Union[Path, str]):
     shutil.copy(Path(__file__).parent / 'template.toml', _filename)
 
 
+def _phantom_up_to_date(path: Path, build_config: Dict[str, Any]) -> bool:
+    """Check whether the Phantom binaries can be reused without make.
+
+    Return True only if phantom and phantomsetup exist, a sidecar file
+    in build/ records a previous successful build with the same
+    configuration, and both binaries are newer than every Fortran source
+    file. Otherwise make must run.
+    """
+    sidecar = path / 'build' / 'build_config.json'
+    binaries = [path / 'bin' / 'phantom', path / 'bin' / 'phantomsetup']
+    if not sidecar.exists() or not all(binary.exists() for binary in binaries):
+        return False
+    try:
+        with open(sidecar, mode='r') as fp:
+            if json.load(fp) != build_config:
+                return False
+    except (OSError, json.JSONDecodeError):
+        return False
+    sources = list((path / 'src').rglob('*.[fF]90'))
+    if not sources:
+        return False
+    latest_source = max(source.stat().st_mtime for source in sources)
+    return all(binary.stat().st_mtime > latest_source for binary in binaries)
+
+
+def _stage_file(src: Path, dst_dir: Path) -> None:
+    """Place a file in a directory, hardlinking instead of copying if possible.
+
+    Hardlinking avoids reading and writing the Phantom binaries, which
+    can be tens of MB each, for every run directory. Fall back to a copy
+    when the run directory is on a different filesystem.
+    """
+    dst = dst_dir / src.name
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def _tee_output(process: 'subprocess.Popen', fp: IO[bytes]) -> None:
+    """Copy subprocess output to stdout and a file as it arrives.
+
+    os.read returns whatever bytes are available, up to 64 KiB at a
+    time, so output streams live rather than stalling until a full
+    buffered chunk (or EOF) accumulates.
+    """
+    assert process.stdout is not None
+    fd = process.stdout.fileno()
+    while True:
+        chunk = os.read(fd, 1 << 16)
+        if not chunk:
+            break
+        sys.stdout.buffer.write(chunk)
+        sys.stdout.flush()
+        fp.write(chunk)
+
+
 def _resolved_path(inp: Union[str, Path]) -> Path:
+    return _resolved_path_cached(str(inp))
+
+
+@functools.lru_cache(maxsize=256)
+def _resolved_path_cached(inp: str) -> Path:
     return pathlib.Path(inp).expanduser().resolve()
@@ -1,5 +1,6 @@
 """Testing phantombuild."""
 
+import subprocess
 import tempfile
 from pathlib import Path
 
@@ -11,9 +12,32 @@ from phantombuild.phantombuild import (
     HDF5LibraryNotFound,
     PatchError,
     RepoError,
+    TOMLError,
 )
 
 
+def test_read_config_extra_options():
+    """Test parsing extra_options in a config file."""
+    config = """
+[phantom]
+path = "~/repos/phantom"
+setup = "disc"
+system = "gfortran"
+extra_options = ["MAXP=1000000", "ISOTHERMAL=no"]
+"""
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        filename = Path(tmpdirname) / 'config.toml'
+        filename.write_text(config)
+        conf = pb.read_config(filename)
+        assert conf['phantom']['extra_options'] == {
+            'MAXP': '1000000',
+            'ISOTHERMAL': 'no',
+        }
+        filename.write_text(config.replace('MAXP=1000000', 'MAXP'))
+        with pytest.raises(TOMLError):
+            pb.read_config(filename)
+
+
 def test_get_phantom():
     """Test getting Phantom from GitHub."""
     with tempfile.TemporaryDirectory() as tmpdirname:
@@ -45,6 +69,31 @@ def test_checkout_phantom_version_dirty():
         pb.checkout_phantom_version(path=path, version=version)
 
 
+def test_checkout_phantom_version_invalid():
+    """Test checking out an invalid Phantom version."""
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = Path(tmpdirname) / 'repo'
+        path.mkdir()
+        subprocess.run(['git', 'init'], cwd=path)
+        (path / 'file.txt').write_text('hello')
+        subprocess.run(['git', 'add', '.'], cwd=path)
+        subprocess.run(
+            [
+                'git',
+                '-c',
+                'user.email=test@test',
+                '-c',
+                'user.name=test',
+                'commit',
+                '-m',
+                'init',
+            ],
+            cwd=path,
+        )
+        with pytest.raises(RepoError):
+            pb.checkout_phantom_version(path=path, version='notarealversion')
+
+
 def test_phantom_patch():
     """Test patching Phantom."""
     with tempfile.TemporaryDirectory() as tmpdirname: